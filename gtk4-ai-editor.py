@@ -4,18 +4,90 @@ GTK4 AI-Powered Writing Assistant
 A lightweight, customizable text editor with llama.cpp integration
 """
 
+import codecs
+import concurrent.futures
+import functools
 import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('GtkSource', '5')
-from gi.repository import Gtk, GtkSource, Gio, GLib, Gdk, Pango
+from gi.repository import Gtk, GtkSource, Gio, GLib, GObject, Gdk, Pango
 import json
 import os
+import queue
+import re
+import stat
 import subprocess
 import sys
+import tempfile
 import threading
 import requests
+from collections import OrderedDict
 from pathlib import Path
 
+try:
+    import orjson  # Optional: faster JSON for config files and streamed replies
+except ImportError:
+    orjson = None
+
+# Total size of context file contents kept in memory between AI requests
+CONTEXT_CACHE_BYTES = 50 * 1024 * 1024
+
+# Files above these sizes open without syntax highlighting / in plain mode
+HIGHLIGHT_MAX_BYTES = 1_000_000
+PLAIN_MODE_BYTES = 20_000_000
+# Rows added to the file tree per main-loop iteration when a folder is filled
+FILE_TREE_BATCH = 200
+# Streamed AI text is written to the chat view at most once per this many ms
+CHAT_FLUSH_MS = 50
+# Context files larger than this are sent as a one-line "skipped" note
+CONTEXT_FILE_MAX_BYTES = 2 * 1024 * 1024
+# Bytes read from the start of a context file to tell text from binary
+TEXT_SNIFF_BYTES = 4096
+
+_MENTION_RE = re.compile(r'@([\w\-.]+)')
+# File panel icons
+_DIR_PREFIX = "📁 "
+_FILE_PREFIX = "📄 "
+
+
+def _approx_tokens(text):
+    """Rough token count for budgeting context (about 4 characters per token)."""
+    return len(text) // 4
+
+
+@functools.lru_cache(maxsize=256)
+def _guess_language(file_name):
+    """GtkSource language for a file's basename, memoized.
+    
+    Keyed on the whole name: languages are also matched by full-name globs
+    (CMakeLists.txt, meson.build, *.desktop.in), not just by suffix.
+    """
+    return GtkSource.LanguageManager.get_default().guess_language(file_name, None)
+
+
+def _json_loads(data):
+    """Parse JSON from str or bytes, with orjson when it is installed."""
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
+def _json_dumps(obj, indent=False):
+    """Serialize *obj* to UTF-8 JSON bytes, with orjson when it is installed."""
+    if orjson:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+    return json.dumps(obj, indent=2 if indent else None).encode()
+
+
+def _is_probably_text(head):
+    """Guess from the first bytes of a file whether it is UTF-8 text."""
+    if b'\x00' in head:
+        return False
+    try:
+        # Incremental decode so a character cut off at the end is not an error
+        codecs.getincrementaldecoder('utf-8')().decode(head)
+        return True
+    except UnicodeDecodeError:
+        return False
+
 
 def _config_path():
     """Config file path; Windows uses AppData/Roaming, Unix uses ~/.config."""
@@ -25,7 +97,11 @@ def _config_path():
 
 
 class Config:
-    """Simple configuration management"""
+    """Simple configuration management
+    
+    Kept as a JSON file rather than GSettings: web/app.py reads and writes the
+    same file, and the Windows build has no dconf backend.
+    """
     DEFAULT_CONFIG = {
         "llama_cpp_url": "http://localhost:8080",
         "system_prompt": "You are a helpful writing assistant. You have access to the user's files and can help with writing, editing, and improving text.",
@@ -38,23 +114,86 @@ class Config:
         "wrap_text": True,
         "default_folder": "",
         "show_file_panel": True,
-        "show_ai_panel": True
+        "show_ai_panel": True,
+        "flat_ui": False
     }
+    # ((path, st_mtime_ns), parsed config) from the last load
+    _cache = None
+    # Copy of the config most recently written by save()
+    _last_saved = None
     
     @staticmethod
     def load():
         config_path = _config_path()
-        if config_path.exists():
-            with open(config_path) as f:
-                return {**Config.DEFAULT_CONFIG, **json.load(f)}
-        return Config.DEFAULT_CONFIG.copy()
+        try:
+            st = config_path.stat()
+        except FileNotFoundError:
+            return Config.DEFAULT_CONFIG.copy()
+        key = (str(config_path), st.st_mtime_ns)
+        if Config._cache and Config._cache[0] == key:
+            return dict(Config._cache[1])
+        with open(config_path, 'rb') as f:
+            data = {**Config.DEFAULT_CONFIG, **_json_loads(f.read())}
+        Config._cache = (key, data)
+        return dict(data)
     
     @staticmethod
     def save(config):
+        if config == Config._last_saved:
+            return
+        Config._cache = None
         config_path = _config_path()
         config_path.parent.mkdir(parents=True, exist_ok=True)
-        with open(config_path, 'w') as f:
-            json.dump(config, f, indent=2)
+        # Serialize first and hand the OS one buffer (json.dump writes piece by piece)
+        data = _json_dumps(config, indent=True)
+        # Write a uniquely named file beside the real one and swap it in, so a crash
+        # never leaves half a config and the web app's saves can't collide with ours
+        fd, tmp_path = tempfile.mkstemp(dir=config_path.parent, prefix=config_path.name + ".", suffix=".tmp")
+        try:
+            try:
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, config_path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        Config._last_saved = dict(config)
+
+
+_pending_config = None        # config waiting to be written by _flush_config
+_config_save_source_id = 0    # GLib timeout that will write it
+
+
+def _schedule_config_save(config):
+    """Save *config* shortly; saves requested within 250 ms are written once."""
+    global _pending_config, _config_save_source_id
+    _pending_config = dict(config)
+    if _config_save_source_id:
+        GLib.source_remove(_config_save_source_id)
+    _config_save_source_id = GLib.timeout_add(250, _on_config_save_timeout)
+
+
+def _on_config_save_timeout():
+    global _config_save_source_id
+    _config_save_source_id = 0
+    _flush_config()
+    return GLib.SOURCE_REMOVE
+
+
+def _flush_config():
+    """Write the pending config now, if there is one."""
+    global _pending_config, _config_save_source_id
+    if _config_save_source_id:
+        GLib.source_remove(_config_save_source_id)
+        _config_save_source_id = 0
+    if _pending_config is not None:
+        Config.save(_pending_config)
+        _pending_config = None
 
 
 class EditorTab:
@@ -62,10 +201,15 @@ class EditorTab:
     def __init__(self, file_path=None):
         self.file_path = file_path
         self.modified = False
+        self._last_displayed_modified = False
         
         # Create source view and buffer
         self.source_view = GtkSource.View()
         self.source_buffer = self.source_view.get_buffer()
+        # Save exactly what is in the buffer (no newline added at the end)
+        self.source_buffer.set_implicit_trailing_newline(False)
+        # On-disk location used by GtkSource.FileLoader / FileSaver
+        self.source_file = GtkSource.File()
         
         # Track modifications
         self.source_buffer.connect("modified-changed", self.on_modified_changed)
@@ -80,6 +224,16 @@ class EditorTab:
         return "*Untitled" if self.modified else "Untitled"
 
 
+class FileItem(GObject.Object):
+    """A file or folder row in the file panel (an empty path marks a placeholder)"""
+    __gtype_name__ = "AIWriterFileItem"
+    
+    label = GObject.Property(type=str, default="")  # icon + name, as shown
+    path = GObject.Property(type=str, default="")
+    is_dir = GObject.Property(type=bool, default=False)
+    in_context = GObject.Property(type=bool, default=False)
+
+
 class AIWriter(Gtk.ApplicationWindow):
     def __init__(self, app):
         super().__init__(application=app, title="AI Writing Assistant")
@@ -87,11 +241,62 @@ class AIWriter(Gtk.ApplicationWindow):
         
         self.config = Config.load()
         self.root_folder = None
-        self.file_contexts = set()  # Paths in AI context
+        # Theme and font CSS last installed (AIWriterApp.do_activate applies the loaded ones)
+        self._last_applied_theme = self.config.get('theme', 'layan-dark')
+        self._last_applied_font = self.config.get('editor_font', 'Monospace 11')
+        # Paths in AI context, in the order they were added (dict used as an ordered set)
+        self.file_contexts = {}
+        # path -> (st_mtime_ns, st_size, content), least recently used first
+        self._ctx_cache = OrderedDict()
+        self._ctx_cache_bytes = 0  # total length of cached contents
+        self._ctx_cache_lock = threading.Lock()
+        # Worker threads for disk reads that should not run one after another
+        self._io_pool = concurrent.futures.ThreadPoolExecutor(max_workers=8)
+        # basename -> [full paths] for files listed in the tree so far (filled by _scan_folder)
+        self._name_index = {}
+        self._indexed_folders = set()  # folders whose files are in _name_index
+        self._index_lock = threading.Lock()
+        # Bumped by load_file_tree; scans started for an older tree are discarded
+        self._tree_generation = 0
+        # folder path -> _list_dir result, so collapsing and re-expanding doesn't rescan
+        self._dir_listings = {}
+        
+        # Keep-alive connection reused for every llama.cpp request
+        self._http = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self._http.mount("http://", adapter)
+        self._http.mount("https://", adapter)  # llama.cpp behind a TLS proxy
+        self._http.headers["Connection"] = "keep-alive"
+        self._http.headers["Content-Type"] = "application/json"
+        
+        # Streaming AI reply state (response is closed by the Stop button)
+        self._ai_response = None
+        self._ai_stream_active = False
+        self._ai_stream_started = False
+        self._ai_cancelled = False
+        self._ai_insert_mark = None
+        # Streamed text waiting for _flush_chat (appended from the AI worker)
+        self._pending_chat = []
+        self._chat_flush_id = 0
+        self._chat_lock = threading.Lock()
+        # Sends are queued and answered one at a time by a single worker
+        self._ai_queue = queue.Queue()
+        self._ai_worker = threading.Thread(target=self._ai_loop, daemon=True)
+        self._ai_worker.start()
+        
+        self._settings_dialog = None
+        self._style_scheme = None  # (theme key, GtkSource.StyleScheme or None)
+        
+        # File dialogs are created once and reused for every open/save
+        self._open_dialog = Gtk.FileDialog.new()
+        self._save_dialog = Gtk.FileDialog.new()
         
         # Tab management
         self.tabs = []  # List of EditorTab objects
+        self.tab_buttons = []  # Tab bar buttons, parallel to self.tabs
         self.current_tab_index = -1
+        self._prev_tab_index = None  # Index whose button is highlighted
+        self._next_tab_id = 0  # Stack child names are never reused
         
         # Panel visibility (restored from config)
         self.file_panel_visible = self.config.get('show_file_panel', True)
@@ -239,23 +444,30 @@ class AIWriter(Gtk.ApplicationWindow):
         scrolled = Gtk.ScrolledWindow()
         scrolled.set_vexpand(True)
         
-        # Tree store: display_name, full_path, in_context (hierarchical for collapsible folders)
-        self.file_store = Gtk.TreeStore(str, str, bool)
-        self.file_tree = Gtk.TreeView(model=self.file_store)
-        
-        # Name column
-        renderer_text = Gtk.CellRendererText()
-        column_text = Gtk.TreeViewColumn("Name", renderer_text, text=0)
-        self.file_tree.append_column(column_text)
-        
-        # Context checkbox column (only meaningful for files)
-        renderer_toggle = Gtk.CellRendererToggle()
-        renderer_toggle.connect("toggled", self.on_context_toggled)
-        column_toggle = Gtk.TreeViewColumn("Ctx", renderer_toggle, active=2)
-        self.file_tree.append_column(column_toggle)
-        
-        # Double-click to open file
-        self.file_tree.connect("row-activated", self.on_file_activated)
+        # Root list holds the open folder; TreeListModel asks _children_of for
+        # a folder's children when its row is expanded
+        self.file_root_store = Gio.ListStore(item_type=FileItem)
+        self.file_tree_model = Gtk.TreeListModel.new(self.file_root_store, False, False, self._children_of)
+        self.file_tree_model.connect("items-changed", self._on_tree_items_changed)
+        self.file_tree = Gtk.ColumnView(model=Gtk.SingleSelection(model=self.file_tree_model))
+        
+        # Name column (expander arrow + icon + name)
+        name_factory = Gtk.SignalListItemFactory()
+        name_factory.connect("setup", self._on_name_setup)
+        name_factory.connect("bind", self._on_name_bind)
+        name_column = Gtk.ColumnViewColumn(title="Name", factory=name_factory)
+        name_column.set_expand(True)
+        self.file_tree.append_column(name_column)
+        
+        # Context checkbox column (only shown for files)
+        ctx_factory = Gtk.SignalListItemFactory()
+        ctx_factory.connect("setup", self._on_ctx_setup)
+        ctx_factory.connect("bind", self._on_ctx_bind)
+        ctx_factory.connect("unbind", self._on_ctx_unbind)
+        self.file_tree.append_column(Gtk.ColumnViewColumn(title="Ctx", factory=ctx_factory))
+        
+        # Double-click opens files and expands/collapses folders
+        self.file_tree.connect("activate", self.on_file_activated)
         
         scrolled.set_child(self.file_tree)
         box.append(scrolled)
@@ -306,6 +518,8 @@ class AIWriter(Gtk.ApplicationWindow):
         self.chat_view.set_margin_start(6)
         self.chat_view.set_margin_end(6)
         self.chat_buffer = self.chat_view.get_buffer()
+        # Right-gravity mark that stays at the end; reused for every auto-scroll
+        self._chat_end_mark = self.chat_buffer.create_mark("end", self.chat_buffer.get_end_iter(), False)
         
         scrolled.set_child(self.chat_view)
         box.append(scrolled)
@@ -327,6 +541,11 @@ class AIWriter(Gtk.ApplicationWindow):
         send_btn.connect("clicked", self.on_send_to_ai)
         input_box.append(send_btn)
         
+        self.stop_btn = Gtk.Button(label="Stop")
+        self.stop_btn.set_sensitive(False)
+        self.stop_btn.connect("clicked", self.on_stop_ai)
+        input_box.append(self.stop_btn)
+        
         box.append(input_box)
         
         return box
@@ -342,18 +561,19 @@ class AIWriter(Gtk.ApplicationWindow):
         scrolled = Gtk.ScrolledWindow()
         scrolled.set_child(tab.source_view)
         
-        tab_name = f"tab_{len(self.tabs)}"
-        self.editor_stack.add_named(scrolled, tab_name)
+        tab.stack_name = f"tab_{self._next_tab_id}"
+        self._next_tab_id += 1
+        self.editor_stack.add_named(scrolled, tab.stack_name)
         
         # Create tab button
         tab_button = Gtk.Button(label=tab.get_display_name())
-        tab_button.connect("clicked", lambda w: self.switch_to_tab(len(self.tabs)))
+        tab_button.connect("clicked", lambda w: self.switch_to_tab(self.tabs.index(tab)))
         
         # Track modified state to update button label
-        tab.source_buffer.connect("modified-changed", 
-                                  lambda b: tab_button.set_label(tab.get_display_name()))
+        tab.source_buffer.connect("modified-changed", self._on_tab_modified_changed, tab, tab_button)
         
         self.tab_box.append(tab_button)
+        self.tab_buttons.append(tab_button)
         
         self.tabs.append(tab)
         self.switch_to_tab(len(self.tabs) - 1)
@@ -369,24 +589,33 @@ class AIWriter(Gtk.ApplicationWindow):
         view.set_monospace(True)
         view.set_wrap_mode(Gtk.WrapMode.WORD if self.config['wrap_text'] else Gtk.WrapMode.NONE)
 
-        # Set theme
-        scheme_manager = GtkSource.StyleSchemeManager.get_default()
-        scheme = scheme_manager.get_scheme(self.config['theme'])
+        # Set theme (the scheme is looked up once per theme change)
+        if self._style_scheme is None or self._style_scheme[0] != self.config['theme']:
+            scheme_manager = GtkSource.StyleSchemeManager.get_default()
+            self._style_scheme = (self.config['theme'], scheme_manager.get_scheme(self.config['theme']))
+        scheme = self._style_scheme[1]
         if scheme:
             view.get_buffer().set_style_scheme(scheme)
     
+    def _on_tab_modified_changed(self, buffer, tab, tab_button):
+        # Only relabel (and relayout the tab bar) when the "*" actually flips
+        modified = buffer.get_modified()
+        if modified == tab._last_displayed_modified:
+            return
+        tab._last_displayed_modified = modified
+        tab_button.set_label(tab.get_display_name())
+    
     def switch_to_tab(self, index):
         """Switch to the specified tab"""
         if 0 <= index < len(self.tabs):
             self.current_tab_index = index
-            self.editor_stack.set_visible_child_name(f"tab_{index}")
+            self.editor_stack.set_visible_child_name(self.tabs[index].stack_name)
             
-            # Update tab button styles (simple highlight)
-            for i, child in enumerate(list(self.tab_box)):
-                if i == index:
-                    child.add_css_class("suggested-action")
-                else:
-                    child.remove_css_class("suggested-action")
+            # Move the highlight from the previous tab button to this one
+            if self._prev_tab_index is not None and self._prev_tab_index < len(self.tab_buttons):
+                self.tab_buttons[self._prev_tab_index].remove_css_class("suggested-action")
+            self.tab_buttons[index].add_css_class("suggested-action")
+            self._prev_tab_index = index
     
     def get_current_tab(self):
         """Get the currently active tab"""
@@ -526,8 +755,9 @@ class AIWriter(Gtk.ApplicationWindow):
         dialog.present()
     
     def on_open_folder(self, button):
-        dialog = Gtk.FileDialog.new()
-        dialog.select_folder(callback=self.on_folder_selected)
+        if self.root_folder:
+            self._open_dialog.set_initial_folder(Gio.File.new_for_path(str(self.root_folder)))
+        self._open_dialog.select_folder(callback=self.on_folder_selected)
     
     def on_folder_selected(self, dialog, result):
         try:
@@ -538,34 +768,156 @@ class AIWriter(Gtk.ApplicationWindow):
         except GLib.Error:
             pass
     
-    def _add_tree_node(self, parent_iter, path):
-        """Add a file or folder row; if folder, add children recursively (collapsible)."""
-        if path.name.startswith('.'):
-            return
-        is_dir = path.is_dir()
-        display = ("📁 " if is_dir else "📄 ") + path.name
-        in_context = (str(path) in self.file_contexts) if not is_dir else False
-        row_iter = self.file_store.append(parent_iter, [display, str(path), in_context])
+    def _list_dir(self, path):
+        """Return (name, path, is_dir) for the visible children of *path*, folders first."""
+        # DirEntry caches the file type from readdir, so no stat() per entry
+        # (only symlinks are stat'ed, so links to folders still expand).
+        # Paths are interned: the same string is shared by the listing cache,
+        # the name index and file_contexts.
+        try:
+            with os.scandir(path) as it:
+                entries = [(e.name, sys.intern(e.path), e.is_dir()) for e in it if not e.name.startswith('.')]
+        except PermissionError:
+            return []
+        entries.sort(key=lambda t: (not t[2], t[0].lower()))
+        return entries
+
+    def _scan_folder(self, path, generation):
+        """Worker: list *path* and add its files to the @mention name index.
+        
+        Nothing is indexed if the tree was reloaded since the scan was queued,
+        or if the folder was already indexed by an overlapping scan.
+        """
+        entries = self._list_dir(path)
+        with self._index_lock:
+            if generation != self._tree_generation or path in self._indexed_folders:
+                return entries
+            self._indexed_folders.add(path)
+            for name, file_path, is_dir in entries:
+                if not is_dir:
+                    self._name_index.setdefault(name, []).append(file_path)
+        return entries
+    
+    def _make_file_item(self, name, path, is_dir):
+        item = FileItem(label=(_DIR_PREFIX if is_dir else _FILE_PREFIX) + name, path=path, is_dir=is_dir)
         if is_dir:
-            try:
-                for item in sorted(path.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-                    self._add_tree_node(row_iter, item)
-            except PermissionError:
-                pass
+            return item
+        item.in_context = path in self.file_contexts
+        item.connect("notify::in-context", self.on_context_toggled)
+        return item
+    
+    def _children_of(self, item, *args):
+        """TreeListModel callback: the child list for a folder row, None for files.
+        
+        GTK also calls this just to decide whether to draw an expander, so it
+        only returns a placeholder; the folder is read once the row is really
+        expanded (see _on_tree_items_changed).
+        """
+        if not item.is_dir:
+            return None
+        store = Gio.ListStore(item_type=FileItem)
+        store.append(FileItem(label="…"))
+        return store
+    
+    def _on_tree_items_changed(self, model, position, removed, added):
+        """Start filling a folder when its placeholder child becomes visible."""
+        if not added:
+            return
+        row = model.get_row(position)
+        parent = row.get_parent() if row else None
+        if parent is None or row.get_item().path:
+            return
+        store = parent.get_children()
+        path = parent.get_item().path
+        entries = self._dir_listings.get(path)
+        if entries is not None:
+            # Expanded before: reuse the listing (still deferred, see below)
+            GLib.idle_add(self._fill_folder, store, entries)
+            return
+        # Read the folder off the UI thread; the placeholder stays until it is done
+        generation = self._tree_generation
+        future = self._io_pool.submit(self._scan_folder, path, generation)
+        future.add_done_callback(lambda f: GLib.idle_add(self._on_folder_scanned, store, path, f, generation))
+    
+    def _on_folder_scanned(self, store, path, future, generation):
+        if generation != self._tree_generation:
+            return GLib.SOURCE_REMOVE  # The tree was reloaded; this store is gone
+        try:
+            entries = future.result()
+        except OSError:
+            entries = []
+        self._dir_listings[path] = entries
+        return self._fill_folder(store, entries)
+    
+    def _fill_folder(self, store, entries):
+        """Replace the placeholder in *store* with *entries*.
+        
+        Rows go in FILE_TREE_BATCH at a time, one splice per idle callback,
+        so a huge folder does not hold up the main loop in one go.
+        """
+        if store.get_n_items() != 1 or store.get_item(0).path:
+            return GLib.SOURCE_REMOVE  # Already filled
+        batch = [self._make_file_item(*entry) for entry in entries[:FILE_TREE_BATCH]]
+        store.splice(0, 1, batch)
+        if len(entries) > FILE_TREE_BATCH:
+            GLib.idle_add(self._append_folder_batch, store, entries, FILE_TREE_BATCH)
+        return GLib.SOURCE_REMOVE
+    
+    def _append_folder_batch(self, store, entries, start):
+        end = start + FILE_TREE_BATCH
+        batch = [self._make_file_item(*entry) for entry in entries[start:end]]
+        store.splice(store.get_n_items(), 0, batch)
+        if end < len(entries):
+            GLib.idle_add(self._append_folder_batch, store, entries, end)
+        return GLib.SOURCE_REMOVE
+    
+    def _on_name_setup(self, factory, list_item):
+        expander = Gtk.TreeExpander()
+        expander.set_child(Gtk.Label(xalign=0))
+        list_item.set_child(expander)
+    
+    def _on_name_bind(self, factory, list_item):
+        row = list_item.get_item()
+        expander = list_item.get_child()
+        expander.set_list_row(row)
+        expander.get_child().set_text(row.get_item().label)
+    
+    def _on_ctx_setup(self, factory, list_item):
+        list_item.set_child(Gtk.CheckButton())
+    
+    def _on_ctx_bind(self, factory, list_item):
+        item = list_item.get_item().get_item()
+        check = list_item.get_child()
+        check.set_visible(bool(item.path) and not item.is_dir)
+        # Two-way: ticking the box sets item.in_context, which on_context_toggled sees
+        list_item.ctx_binding = item.bind_property(
+            "in-context", check, "active",
+            GObject.BindingFlags.SYNC_CREATE | GObject.BindingFlags.BIDIRECTIONAL)
+    
+    def _on_ctx_unbind(self, factory, list_item):
+        list_item.ctx_binding.unbind()
+        list_item.ctx_binding = None
 
     def load_file_tree(self):
-        self.file_store.clear()
-        if not self.root_folder:
+        self.file_root_store.remove_all()
+        with self._index_lock:
+            self._tree_generation += 1
+            self._name_index = {}
+            self._indexed_folders = set()
+        self._dir_listings = {}
+        if not self.root_folder or self.root_folder.name.startswith('.'):
             return
-        self._add_tree_node(None, self.root_folder)
+        self.file_root_store.append(FileItem(
+            label=_DIR_PREFIX + self.root_folder.name, path=str(self.root_folder), is_dir=True))
+        self.file_tree_model.get_row(0).set_expanded(True)
     
-    def on_file_activated(self, tree_view, path, column):
-        model = tree_view.get_model()
-        iter = model.get_iter(path)
-        file_path = model.get_value(iter, 1)
-        
-        if os.path.isfile(file_path):
-            self.open_file(file_path)
+    def on_file_activated(self, column_view, position):
+        row = self.file_tree_model.get_row(position)
+        item = row.get_item()
+        if item.is_dir:
+            row.set_expanded(not row.get_expanded())
+        elif item.path:
+            self.open_file(item.path)
     
     def open_file(self, file_path):
         """Open a file in a new tab or switch to existing tab"""
@@ -575,22 +927,49 @@ class AIWriter(Gtk.ApplicationWindow):
                 self.switch_to_tab(i)
                 return
         
-        # Open in new tab
+        # Open in new tab; GtkSource.FileLoader reads it in without blocking the UI
         try:
-            with open(file_path, 'r') as f:
-                content = f.read()
-            
-            tab = self.create_new_tab(file_path)
-            tab.source_buffer.set_text(content)
-            tab.source_buffer.set_modified(False)
-            
+            size = os.path.getsize(file_path)
+        except OSError as e:
+            self.show_error(f"Error opening file: {e}")
+            return
+        
+        tab = self.create_new_tab(file_path)
+        if size > PLAIN_MODE_BYTES:
+            tab.source_buffer.set_highlight_syntax(False)
+            tab.source_view.set_highlight_current_line(False)
+        tab.source_file.set_location(Gio.File.new_for_path(file_path))
+        loader = GtkSource.FileLoader.new(tab.source_buffer, tab.source_file)
+        loader.load_async(
+            io_priority=GLib.PRIORITY_DEFAULT, cancellable=None, progress_callback=None,
+            callback=lambda source, result, *_: self._on_file_loaded(tab, source, result, size),
+        )
+    
+    def _on_file_loaded(self, tab, loader, result, size):
+        try:
+            loader.load_finish(result)
+        except GLib.Error as e:
+            # Invalid bytes were escaped but the text is loaded; anything else failed
+            if not e.matches(GtkSource.FileLoaderError.quark(), GtkSource.FileLoaderError.CONVERSION_FALLBACK):
+                self.show_error(f"Error opening file: {e.message}")
+                # Drop the half-filled tab: saving it would overwrite the file, and
+                # while it stays open a second open would not retry the load
+                if tab in self.tabs:
+                    self._remove_tab(self.tabs.index(tab))
+                return
+        tab.source_buffer.set_modified(False)
+        
+        if size > HIGHLIGHT_MAX_BYTES:
+            # Highlighting a file this size would freeze the UI
+            self.add_chat_message(
+                "System",
+                f"{os.path.basename(tab.file_path)} is {size / 1_000_000:.1f} MB; syntax highlighting is off",
+            )
+        else:
             # Auto-detect language
-            lang_manager = GtkSource.LanguageManager.get_default()
-            language = lang_manager.guess_language(file_path, None)
+            language = _guess_language(os.path.basename(tab.file_path))
             if language:
                 tab.source_buffer.set_language(language)
-        except Exception as e:
-            self.show_error(f"Error opening file: {e}")
     
     def on_save_file(self, button):
         """Save the current tab"""
@@ -600,8 +979,9 @@ class AIWriter(Gtk.ApplicationWindow):
         
         if not tab.file_path:
             # Need to show save dialog
-            dialog = Gtk.FileDialog.new()
-            dialog.save(callback=self.on_file_save_dialog)
+            if self.root_folder:
+                self._save_dialog.set_initial_folder(Gio.File.new_for_path(str(self.root_folder)))
+            self._save_dialog.save(callback=self.on_file_save_dialog)
             return
         
         self.save_tab(tab)
@@ -619,19 +999,30 @@ class AIWriter(Gtk.ApplicationWindow):
             pass
     
     def save_tab(self, tab):
-        """Save a specific tab to disk"""
+        """Save a specific tab to disk.
+        
+        GtkSource.FileSaver writes straight from the buffer on a GIO worker;
+        the file is replaced atomically, keeping its permissions.
+        """
+        tab.source_file.set_location(Gio.File.new_for_path(tab.file_path))
+        saver = GtkSource.FileSaver.new(tab.source_buffer, tab.source_file)
+        # Overwrite like a plain write would, even if the file changed on disk
+        saver.set_flags(GtkSource.FileSaverFlags.IGNORE_MODIFICATION_TIME)
+        saver.save_async(
+            io_priority=GLib.PRIORITY_DEFAULT, cancellable=None, progress_callback=None,
+            callback=lambda source, result, *_: self._on_tab_saved(tab, source, result),
+        )
+    
+    def _on_tab_saved(self, tab, saver, result):
         try:
-            start = tab.source_buffer.get_start_iter()
-            end = tab.source_buffer.get_end_iter()
-            content = tab.source_buffer.get_text(start, end, False)
-            
-            with open(tab.file_path, 'w') as f:
-                f.write(content)
-            
-            tab.source_buffer.set_modified(False)
-            self.add_chat_message("System", f"Saved {os.path.basename(tab.file_path)}")
-        except Exception as e:
-            self.show_error(f"Error saving file: {e}")
+            saver.save_finish(result)
+        except GLib.Error as e:
+            self.show_error(f"Error saving file: {e.message}")
+            return
+        with self._ctx_cache_lock:
+            self._drop_cached_context(tab.file_path)
+        tab.source_buffer.set_modified(False)
+        self.add_chat_message("System", f"Saved {os.path.basename(tab.file_path)}")
     
     def on_new_file(self, button):
         """Create a new empty tab"""
@@ -649,57 +1040,53 @@ class AIWriter(Gtk.ApplicationWindow):
             # TODO: Show confirmation dialog
             pass
         
+        self._remove_tab(self.current_tab_index)
+    
+    def _remove_tab(self, index):
+        """Remove the tab at *index* and show a neighbouring (or new empty) tab."""
+        tab = self.tabs[index]
+        
         # Remove from UI
-        tab_name = f"tab_{self.current_tab_index}"
-        self.editor_stack.remove(self.editor_stack.get_child_by_name(tab_name))
+        self.editor_stack.remove(self.editor_stack.get_child_by_name(tab.stack_name))
         
         # Remove tab button
-        child = list(self.tab_box)[self.current_tab_index]
-        self.tab_box.remove(child)
+        self.tab_box.remove(self.tab_buttons.pop(index))
         
         # Remove from tabs list
-        self.tabs.pop(self.current_tab_index)
-        
-        # Renumber remaining tabs
-        for i in range(self.current_tab_index, len(self.tabs)):
-            old_name = f"tab_{i+1}"
-            new_name = f"tab_{i}"
-            child = self.editor_stack.get_child_by_name(old_name)
-            if child:
-                # GTK4 doesn't have a direct rename, so we need to work around it
-                pass
+        self.tabs.pop(index)
         
-        # Switch to adjacent tab
+        if index != self.current_tab_index:
+            # Another tab stays current; its index shifts if it came after this one
+            if index < self.current_tab_index:
+                self.current_tab_index -= 1
+            self._prev_tab_index = self.current_tab_index
+            return
+        
+        # The highlighted button went with the tab; switch to the adjacent tab
+        self._prev_tab_index = None
         if self.tabs:
-            new_index = min(self.current_tab_index, len(self.tabs) - 1)
+            new_index = min(index, len(self.tabs) - 1)
             self.switch_to_tab(new_index)
         else:
             self.current_tab_index = -1
             # Create a new empty tab
             self.create_new_tab()
     
-    def on_context_toggled(self, widget, path):
-        row_iter = self.file_store.get_iter(path)
-        file_path = self.file_store.get_value(row_iter, 1)
-        if not os.path.isfile(file_path):
-            return  # Only files can be in context
-        current_state = self.file_store.get_value(row_iter, 2)
-        new_state = not current_state
-        self.file_store.set_value(row_iter, 2, new_state)
-        if new_state:
-            self.file_contexts.add(file_path)
+    def on_context_toggled(self, item, pspec):
+        """Keep file_contexts in step with a file item's in-context property."""
+        if item.in_context == (item.path in self.file_contexts):
+            return  # Already in step (e.g. on_clear_context)
+        if item.in_context:
+            self.file_contexts[sys.intern(item.path)] = None
         else:
-            self.file_contexts.discard(file_path)
+            del self.file_contexts[item.path]
         self.update_context_label()
     
-    def _clear_context_in_tree(self, model, path, row_iter):
-        """Walk tree and set all in_context to False."""
-        model.set_value(row_iter, 2, False)
-        return False  # continue
-
     def on_clear_context(self, button):
         self.file_contexts.clear()
-        self.file_store.foreach(self._clear_context_in_tree)
+        # Collapsed folders drop their rows and rebuild them from file_contexts
+        for i in range(self.file_tree_model.get_n_items()):
+            self.file_tree_model.get_row(i).get_item().in_context = False
         self.update_context_label()
     
     def update_context_label(self):
@@ -717,66 +1104,202 @@ class AIWriter(Gtk.ApplicationWindow):
         # Parse @mentions and add to context temporarily
         mentioned_files = self.parse_mentions(user_message)
         
-        # Start AI request in background thread
-        thread = threading.Thread(target=self.send_to_llama, args=(user_message, mentioned_files))
-        thread.daemon = True
-        thread.start()
+        # Hand the request to the AI worker
+        self._ai_queue.put((user_message, mentioned_files))
+    
+    def _ai_loop(self):
+        """AI worker: send queued messages to llama.cpp one turn at a time.
+        
+        Messages that queued up while a reply was streaming are merged into
+        a single turn, so the server sees one request instead of several.
+        """
+        while True:
+            user_message, mentioned_files = self._ai_queue.get()
+            messages, mentioned = [user_message], list(mentioned_files)
+            while True:
+                try:
+                    more_message, more_files = self._ai_queue.get_nowait()
+                except queue.Empty:
+                    break
+                messages.append(more_message)
+                mentioned += [p for p in more_files if p not in mentioned]
+            self.send_to_llama("\n\n".join(messages), mentioned)
     
     def parse_mentions(self, text):
         """Extract @filename mentions from text"""
-        import re
-        mentions = re.findall(r'@([\w\-\.]+)', text)
-        mentioned_paths = []
-        
-        if self.root_folder:
+        if '@' not in text:
+            return []  # Most messages mention nothing; skip the regex entirely
+        mentions = _MENTION_RE.findall(text)
+        if not self.root_folder or not mentions:
+            return []
+        
+        # Files already listed in the tree resolve without touching the disk
+        found = {}
+        with self._index_lock:
             for mention in mentions:
-                # Search for file in tree
-                for file_path in Path(self.root_folder).rglob(mention):
-                    if file_path.is_file():
-                        mentioned_paths.append(str(file_path))
-                        break
-        
-        return mentioned_paths
+                if mention in self._name_index:
+                    found[mention] = self._name_index[mention][0]
+        
+        # Folders not expanded yet: one walk finds all the rest, skipping hidden folders
+        wanted = set(mentions) - found.keys()
+        if wanted:
+            for root, dirs, files in os.walk(self.root_folder):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+                for name in wanted.intersection(files):
+                    found[name] = sys.intern(os.path.join(root, name))
+                wanted.difference_update(files)
+                if not wanted:
+                    break
+        
+        return [found[m] for m in dict.fromkeys(mentions) if m in found]
+    
+    def _context_cache_get(self, file_path, key):
+        """Return the cache entry for *file_path* if *key* (mtime_ns, size) still matches, else None.
+        
+        The entry is (mtime_ns, size, content); content is None for binary files.
+        """
+        with self._ctx_cache_lock:
+            hit = self._ctx_cache.get(file_path)
+            if hit and hit[:2] == key:
+                self._ctx_cache.move_to_end(file_path)
+                return hit
+        return None
+    
+    def _load_context_file(self, file_path, key):
+        """Read *file_path* from disk and cache it under *key*; None if it looks binary."""
+        if key[1] > CONTEXT_FILE_MAX_BYTES:
+            # Never read it: a stub tells the model the file exists
+            content = f"[{os.path.basename(file_path)} too large ({key[1]} bytes), skipped]"
+        else:
+            with open(file_path, 'rb') as f:
+                head = f.read(TEXT_SNIFF_BYTES)
+                # Binary files are cached as None so they are only sniffed once;
+                # stray bad bytes further in are replaced rather than failing the read
+                content = (head + f.read()).decode('utf-8', 'replace') if _is_probably_text(head) else None
+        with self._ctx_cache_lock:
+            self._drop_cached_context(file_path)
+            self._ctx_cache[file_path] = (*key, content)
+            if content is not None:
+                self._ctx_cache_bytes += len(content)
+            # Evict least recently used files until back under the byte budget
+            while self._ctx_cache_bytes > CONTEXT_CACHE_BYTES and len(self._ctx_cache) > 1:
+                self._drop_cached_context(next(iter(self._ctx_cache)))
+        return content
+    
+    def _drop_cached_context(self, file_path):
+        """Remove *file_path* from the context cache; caller holds _ctx_cache_lock."""
+        old = self._ctx_cache.pop(file_path, None)
+        if old is not None and old[2] is not None:
+            self._ctx_cache_bytes -= len(old[2])
+    
+    def _read_context_files(self, paths):
+        """Return {path: content} for *paths*, reading changed files concurrently.
+        
+        Files that are unchanged since the last read come from the cache and
+        never reach the thread pool; unreadable, binary and non-regular files
+        (directories, FIFOs) are left out using the same stat.
+        """
+        contents = {}
+        pending = {}
+        for file_path in paths:
+            try:
+                st = os.stat(file_path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            key = (st.st_mtime_ns, st.st_size)
+            hit = self._context_cache_get(file_path, key)
+            if hit is None:
+                pending[file_path] = self._io_pool.submit(self._load_context_file, file_path, key)
+            elif hit[2] is not None:
+                contents[file_path] = hit[2]
+        for file_path, future in pending.items():
+            try:
+                content = future.result()
+            except Exception:
+                continue
+            if content is not None:
+                contents[file_path] = content
+        return contents
+    
+    def _context_name(self, file_path):
+        """Name used in context headers: path relative to the open folder when inside it."""
+        if self.root_folder:
+            try:
+                return str(Path(file_path).relative_to(self.root_folder))
+            except ValueError:
+                pass
+        return os.path.basename(file_path)
     
     def build_context(self, mentioned_files):
-        """Build context from selected files and current file"""
-        context_parts = []
-        
-        # Add current file
+        """Build context from selected files and current file.
+        
+        Parts go from most to least stable (selected files in the order they
+        were added, then mentions, then the file being edited) so the prompt
+        prefix stays byte-identical across turns and llama.cpp can reuse its
+        KV cache for it.
+        
+        The result is kept within context_max_tokens (by _approx_tokens).
+        Space goes to the current file first, then mentioned files, then
+        selected files; the file that would overflow keeps its head and
+        tail, and any after it are dropped.
+        """
         tab = self.get_current_tab()
+        
+        # Explicitly selected context files, then mentioned files, each path once;
+        # the current file is sent from its buffer below, so it is skipped here
+        seen = {tab.file_path} if tab and tab.file_path else set()
+        paths = []
+        for p in (*self.file_contexts, *mentioned_files):
+            if p not in seen:
+                seen.add(p)
+                paths.append(p)
+        contents = self._read_context_files(paths)
+        paths = [p for p in paths if p in contents]
+        parts = [[f"=== {self._context_name(p)} ===\n", contents[p]] for p in paths]
+        # Indexes into parts, most important first: mentioned files, then selected ones
+        mentioned = set(mentioned_files)
+        priority = sorted(range(len(paths)), key=lambda i: paths[i] not in mentioned)
+        
+        # Add current file last: it is the part most likely to change between turns
         if tab and tab.file_path:
             try:
                 start = tab.source_buffer.get_start_iter()
                 end = tab.source_buffer.get_end_iter()
-                content = tab.source_buffer.get_text(start, end, False)
-                context_parts.append(f"=== Current File: {os.path.basename(tab.file_path)} ===\n{content}\n")
+                parts.append([f"=== Current File: {self._context_name(tab.file_path)} ===\n",
+                              tab.source_buffer.get_text(start, end, False)])
+                priority.insert(0, len(parts) - 1)
             except:
                 pass
         
-        # Add explicitly selected context files
-        for file_path in self.file_contexts:
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, 'r') as f:
-                        content = f.read()
-                    context_parts.append(f"=== {os.path.basename(file_path)} ===\n{content}\n")
-                except:
-                    pass
-        
-        # Add mentioned files
-        for file_path in mentioned_files:
-            if file_path not in self.file_contexts and (not tab or file_path != tab.file_path):
-                try:
-                    with open(file_path, 'r') as f:
-                        content = f.read()
-                    context_parts.append(f"=== {os.path.basename(file_path)} ===\n{content}\n")
-                except:
-                    pass
+        # Pack parts into the token budget in priority order
+        remaining = self.config.get('context_max_tokens', 6000)
+        dropped = 0
+        for i in priority:
+            header, content = parts[i]
+            cost = _approx_tokens(header) + _approx_tokens(content) + 1
+            if cost <= remaining:
+                remaining -= cost
+                continue
+            room = (remaining - _approx_tokens(header) - 8) * 4
+            if room > 0:
+                head = room // 2
+                parts[i][1] = f"{content[:head]}\n…[truncated]…\n{content[len(content) - (room - head):]}"
+                remaining = 0
+            else:
+                parts[i] = None
+                dropped += 1
+        if dropped:
+            GLib.idle_add(self.add_chat_message, "System",
+                          f"Dropped {dropped} file{'s' if dropped != 1 else ''} exceeding the context budget")
         
-        return "\n".join(context_parts)
+        return "\n".join(f"{header}{content}\n" for header, content in filter(None, parts))
     
     def send_to_llama(self, user_message, mentioned_files):
         """Send request to llama.cpp server"""
+        # A Stop pressed during an earlier reply must not hide this turn's errors
+        self._ai_cancelled = False
         try:
             context = self.build_context(mentioned_files)
             
@@ -790,48 +1313,177 @@ class AIWriter(Gtk.ApplicationWindow):
             
             messages.append({"role": "user", "content": user_message})
             
-            # Send to llama.cpp
-            response = requests.post(
+            # Serialize once to bytes and drop the str copies before posting;
+            # the session already sends Content-Type: application/json
+            body = _json_dumps({
+                "messages": messages,
+                "temperature": self.config['temperature'],
+                "max_tokens": self.config['max_tokens'],
+                "stream": True,
+                "cache_prompt": True
+            })
+            del context, messages
+            
+            # Send to llama.cpp; the reply arrives as server-sent events
+            response = self._http.post(
                 f"{self.config['llama_cpp_url']}/v1/chat/completions",
-                json={
-                    "messages": messages,
-                    "temperature": self.config['temperature'],
-                    "max_tokens": self.config['max_tokens']
-                },
+                data=body,
+                stream=True,
                 timeout=120
             )
             
-            if response.status_code == 200:
-                data = response.json()
-                ai_response = data['choices'][0]['message']['content']
-                GLib.idle_add(self.add_chat_message, "AI", ai_response)
-            else:
+            if response.status_code != 200:
+                response.close()
                 GLib.idle_add(self.add_chat_message, "Error", f"API error: {response.status_code}")
+                return
+            
+            self._ai_response = response
+            self._ai_stream_active = True
+            # Same priority as the CHAT_FLUSH_MS timeout, so a busy main loop
+            # cannot run the first flush before the insert mark exists
+            GLib.idle_add(self._begin_ai_stream, priority=GLib.PRIORITY_DEFAULT)
+            try:
+                self._read_ai_stream(response)
+            finally:
+                self._ai_stream_active = False
+                self._ai_response = None
+                response.close()
+                # Same priority as _begin_ai_stream: equal-priority sources run in
+                # the order they were added, so this turn ends before the next begins
+                GLib.idle_add(self._end_ai_stream, self._ai_cancelled, priority=GLib.PRIORITY_DEFAULT)
         
         except requests.exceptions.ConnectionError:
-            GLib.idle_add(self.add_chat_message, "Error", "Cannot connect to llama.cpp server. Is it running on port 8080?")
+            if not self._ai_cancelled:
+                GLib.idle_add(self.add_chat_message, "Error", "Cannot connect to llama.cpp server. Is it running on port 8080?")
         except Exception as e:
-            GLib.idle_add(self.add_chat_message, "Error", f"Error: {str(e)}")
+            if not self._ai_cancelled:
+                GLib.idle_add(self.add_chat_message, "Error", f"Error: {str(e)}")
+    
+    def _read_ai_stream(self, response):
+        """Forward each streamed content delta to the chat view."""
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            payload = line[len("data: "):]
+            if payload == "[DONE]":
+                break
+            choices = _json_loads(payload).get("choices") or []
+            piece = choices[0].get("delta", {}).get("content") if choices else None
+            if piece:
+                self.add_chat_delta(piece)
+    
+    def add_chat_delta(self, delta):
+        """Queue streamed reply text for the chat view (safe from any thread).
+        
+        Deltas are a token or two each; they are written in one insert per
+        CHAT_FLUSH_MS so the chat view lays out once per flush, not per token.
+        """
+        with self._chat_lock:
+            self._pending_chat.append(delta)
+            if not self._chat_flush_id:
+                self._chat_flush_id = GLib.timeout_add(CHAT_FLUSH_MS, self._flush_chat)
+    
+    def _flush_chat(self):
+        with self._chat_lock:
+            text = "".join(self._pending_chat)
+            self._pending_chat.clear()
+            self._chat_flush_id = 0
+        if text:
+            self._append_ai_chunk(text)
+        return GLib.SOURCE_REMOVE
+    
+    def _begin_ai_stream(self):
+        self._ai_stream_started = False
+        # The reply is inserted at this mark; it moves along as text goes in
+        self._ai_insert_mark = self.chat_buffer.create_mark(None, self.chat_buffer.get_end_iter(), False)
+        self.stop_btn.set_sensitive(True)
+    
+    def _append_ai_chunk(self, piece):
+        """Append streamed text to the chat view (the first chunk adds the [AI] header)."""
+        if not self._ai_stream_started:
+            self._ai_stream_started = True
+            piece = "\n[AI]\n" + piece
+        self.chat_buffer.insert(self.chat_buffer.get_iter_at_mark(self._ai_insert_mark), piece)
+        self._scroll_chat_to_end()
+    
+    def _end_ai_stream(self, cancelled):
+        # Write out whatever is still waiting for the flush timeout
+        with self._chat_lock:
+            flush_id = self._chat_flush_id
+        if flush_id:
+            GLib.source_remove(flush_id)
+        self._flush_chat()
+        if self._ai_stream_started:
+            self._append_ai_chunk("\n")
+        self.chat_buffer.delete_mark(self._ai_insert_mark)
+        self._ai_insert_mark = None
+        # *cancelled* is passed in: the next turn may already have reset the flag
+        if cancelled:
+            self.add_chat_message("System", "Response stopped")
+        self.stop_btn.set_sensitive(False)
+    
+    def on_stop_ai(self, button):
+        """Stop the AI reply that is currently streaming."""
+        response = self._ai_response
+        if self._ai_stream_active and response is not None:
+            self._ai_cancelled = True
+            response.close()
+    
+    def _insert_chat_text(self, text):
+        """Append *text* to the chat view and scroll to the bottom."""
+        self.chat_buffer.insert(self.chat_buffer.get_end_iter(), text)
+        self._scroll_chat_to_end()
+    
+    def _scroll_chat_to_end(self):
+        self.chat_buffer.move_mark(self._chat_end_mark, self.chat_buffer.get_end_iter())
+        self.chat_view.scroll_to_mark(self._chat_end_mark, 0.0, True, 0.0, 1.0)
     
     def add_chat_message(self, sender, message):
         """Add message to chat view"""
-        end_iter = self.chat_buffer.get_end_iter()
-        self.chat_buffer.insert(end_iter, f"\n[{sender}]\n{message}\n")
-        
-        # Auto-scroll to bottom
-        mark = self.chat_buffer.create_mark(None, self.chat_buffer.get_end_iter(), False)
-        self.chat_view.scroll_to_mark(mark, 0.0, True, 0.0, 1.0)
+        self._insert_chat_text(f"\n[{sender}]\n{message}\n")
     
     def on_settings(self, button):
-        dialog = SettingsDialog(self, self.config)
-        dialog.present()
+        # Built on first use, then hidden and re-shown with the current config
+        if self._settings_dialog is None:
+            self._settings_dialog = SettingsDialog(self, self.config)
+        else:
+            self._settings_dialog.refresh(self.config)
+        self._settings_dialog.present()
     
-    def apply_settings(self):
-        """Apply settings to all open editors"""
-        apply_app_theme(self.config.get('theme', 'layan-dark'))
-        apply_editor_font(self.config)
+    def apply_settings(self, changed_keys=None):
+        """Apply settings to all open editors.
+        
+        *changed_keys* limits the work to the config keys that changed;
+        None re-applies everything.
+        """
+        theme = self.config.get('theme', 'layan-dark')
+        if theme != self._last_applied_theme:
+            apply_app_theme(theme)
+            self._last_applied_theme = theme
+        font = self.config.get('editor_font', 'Monospace 11')
+        if font != self._last_applied_font:
+            apply_editor_font(self.config)
+            self._last_applied_font = font
+        if changed_keys is None or 'flat_ui' in changed_keys:
+            apply_flat_ui(self.config.get('flat_ui', False))
+        
+        full = changed_keys is None or 'theme' in changed_keys
+        wrap_mode = Gtk.WrapMode.WORD if self.config['wrap_text'] else Gtk.WrapMode.NONE
         for tab in self.tabs:
-            self.configure_editor_view(tab.source_view)
+            view = tab.source_view
+            # Hold notify:: signals so each view handles its property changes in one go
+            view.freeze_notify()
+            try:
+                if full:
+                    self.configure_editor_view(view)
+                    continue
+                # Line numbers / wrapping only: set just that property
+                if 'show_line_numbers' in changed_keys:
+                    view.set_show_line_numbers(self.config['show_line_numbers'])
+                if 'wrap_text' in changed_keys:
+                    view.set_wrap_mode(wrap_mode)
+            finally:
+                view.thaw_notify()
     
     def show_error(self, message):
         self.add_chat_message("Error", message)
@@ -844,9 +1496,9 @@ class SettingsDialog(Gtk.Window):
         self.set_modal(True)
         self.set_title("Settings")
         self.set_default_size(500, 650)
+        self.set_hide_on_close(True)  # Reused by AIWriter.on_settings
         
         self.parent_window = parent
-        self.config = config.copy()
         
         box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=12)
         box.set_margin_start(12)
@@ -860,7 +1512,6 @@ class SettingsDialog(Gtk.Window):
         url_label.set_size_request(150, -1)
         url_label.set_halign(Gtk.Align.START)
         self.url_entry = Gtk.Entry()
-        self.url_entry.set_text(self.config['llama_cpp_url'])
         self.url_entry.set_hexpand(True)
         url_box.append(url_label)
         url_box.append(self.url_entry)
@@ -876,7 +1527,6 @@ class SettingsDialog(Gtk.Window):
         self.prompt_view = Gtk.TextView()
         self.prompt_view.set_wrap_mode(Gtk.WrapMode.WORD)
         self.prompt_buffer = self.prompt_view.get_buffer()
-        self.prompt_buffer.set_text(self.config['system_prompt'])
         scrolled.set_child(self.prompt_view)
         box.append(scrolled)
         
@@ -889,7 +1539,6 @@ class SettingsDialog(Gtk.Window):
         self.temp_spin.set_range(0.0, 2.0)
         self.temp_spin.set_increments(0.1, 0.1)
         self.temp_spin.set_digits(1)
-        self.temp_spin.set_value(self.config['temperature'])
         temp_box.append(temp_label)
         temp_box.append(self.temp_spin)
         box.append(temp_box)
@@ -900,7 +1549,6 @@ class SettingsDialog(Gtk.Window):
         font_label.set_size_request(150, -1)
         font_label.set_halign(Gtk.Align.START)
         self.font_entry = Gtk.Entry()
-        self.font_entry.set_text(self.config.get('editor_font', 'Monospace 11'))
         self.font_entry.set_placeholder_text("e.g. Monospace 11")
         self.font_entry.set_hexpand(True)
         font_box.append(font_label)
@@ -909,27 +1557,23 @@ class SettingsDialog(Gtk.Window):
 
         # Show line numbers checkbox
         self.line_numbers_check = Gtk.CheckButton(label="Show Line Numbers")
-        self.line_numbers_check.set_active(self.config['show_line_numbers'])
         box.append(self.line_numbers_check)
 
         # Wrap text checkbox
         self.wrap_text_check = Gtk.CheckButton(label="Wrap Text")
-        self.wrap_text_check.set_active(self.config['wrap_text'])
         box.append(self.wrap_text_check)
 
+        # Flat UI checkbox
+        self.flat_ui_check = Gtk.CheckButton(label="Flat UI (no shadows or animations)")
+        box.append(self.flat_ui_check)
+
         # Theme selector
         theme_box = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         theme_label = Gtk.Label(label="Theme:")
         theme_label.set_size_request(150, -1)
         theme_label.set_halign(Gtk.Align.START)
         self.theme_dropdown = Gtk.DropDown()
-        theme_keys = list(AVAILABLE_THEMES.keys())
-        theme_labels = [k.replace('-', ' ').title() for k in theme_keys]
-        self.theme_dropdown.set_model(Gtk.StringList.new(theme_labels))
-        current = self.config.get('theme', 'layan-dark')
-        if current in theme_keys:
-            self.theme_dropdown.set_selected(theme_keys.index(current))
-        self._theme_keys = theme_keys
+        self.theme_dropdown.set_model(_theme_stringlist())
         theme_box.append(theme_label)
         theme_box.append(self.theme_dropdown)
         box.append(theme_box)
@@ -947,7 +1591,6 @@ class SettingsDialog(Gtk.Window):
         folder_label.set_size_request(150, -1)
         folder_label.set_halign(Gtk.Align.START)
         self.folder_entry = Gtk.Entry()
-        self.folder_entry.set_text(self.config.get('default_folder', ''))
         self.folder_entry.set_placeholder_text("None (pick each time)")
         self.folder_entry.set_hexpand(True)
         browse_btn = Gtk.Button(label="Browse…")
@@ -962,11 +1605,9 @@ class SettingsDialog(Gtk.Window):
 
         # Default panel visibility
         self.file_panel_check = Gtk.CheckButton(label="Show File Panel on start")
-        self.file_panel_check.set_active(self.config.get('show_file_panel', True))
         box.append(self.file_panel_check)
 
         self.ai_panel_check = Gtk.CheckButton(label="Show AI Panel on start")
-        self.ai_panel_check.set_active(self.config.get('show_ai_panel', True))
         box.append(self.ai_panel_check)
 
         # Max tokens
@@ -978,7 +1619,6 @@ class SettingsDialog(Gtk.Window):
         self.max_tokens_spin.set_range(100, 32000)
         self.max_tokens_spin.set_increments(100, 500)
         self.max_tokens_spin.set_digits(0)
-        self.max_tokens_spin.set_value(self.config.get('max_tokens', 2000))
         max_tokens_box.append(max_tokens_label)
         max_tokens_box.append(self.max_tokens_spin)
         box.append(max_tokens_box)
@@ -989,7 +1629,7 @@ class SettingsDialog(Gtk.Window):
         button_box.set_margin_top(12)
 
         cancel_btn = Gtk.Button(label="Cancel")
-        cancel_btn.connect("clicked", lambda w: self.close())
+        cancel_btn.connect("clicked", lambda w: self.set_visible(False))
         button_box.append(cancel_btn)
 
         save_btn = Gtk.Button(label="Save")
@@ -999,6 +1639,39 @@ class SettingsDialog(Gtk.Window):
         box.append(button_box)
 
         self.set_child(box)
+        self._shown_prompt = None  # system prompt last loaded into prompt_buffer
+        self.refresh(config)
+
+    def refresh(self, config):
+        """Load *config* into the widgets (the dialog is kept and reopened).
+        
+        Widgets already showing the right value are left alone. *config* is
+        the window's own dict; on_save updates it in place.
+        """
+        self._original = config
+        for entry, value in ((self.url_entry, config['llama_cpp_url']),
+                             (self.font_entry, config.get('editor_font', 'Monospace 11')),
+                             (self.folder_entry, config.get('default_folder', ''))):
+            if entry.get_text() != value:
+                entry.set_text(value)
+        if self.prompt_buffer.get_modified() or config['system_prompt'] != self._shown_prompt:
+            self.prompt_buffer.set_text(config['system_prompt'])
+            self.prompt_buffer.set_modified(False)  # on_save only re-reads an edited prompt
+            self._shown_prompt = config['system_prompt']
+        for spin, value in ((self.temp_spin, config['temperature']),
+                            (self.max_tokens_spin, config.get('max_tokens', 2000))):
+            if spin.get_value() != value:
+                spin.set_value(value)
+        for check, value in ((self.line_numbers_check, config['show_line_numbers']),
+                             (self.wrap_text_check, config['wrap_text']),
+                             (self.flat_ui_check, config.get('flat_ui', False)),
+                             (self.file_panel_check, config.get('show_file_panel', True)),
+                             (self.ai_panel_check, config.get('show_ai_panel', True))):
+            if check.get_active() != value:
+                check.set_active(value)
+        current = config.get('theme', 'layan-dark')
+        if current in _THEME_KEYS and self.theme_dropdown.get_selected() != _THEME_KEYS.index(current):
+            self.theme_dropdown.set_selected(_THEME_KEYS.index(current))
 
     def _on_browse_folder(self, button):
         """Open a folder chooser to pick the default folder."""
@@ -1014,27 +1687,38 @@ class SettingsDialog(Gtk.Window):
             pass
 
     def on_save(self, button):
-        self.config['llama_cpp_url'] = self.url_entry.get_text()
-        self.config['temperature'] = self.temp_spin.get_value()
-        self.config['editor_font'] = self.font_entry.get_text().strip() or "Monospace 11"
-        self.config['show_line_numbers'] = self.line_numbers_check.get_active()
-        self.config['wrap_text'] = self.wrap_text_check.get_active()
-        self.config['theme'] = self._theme_keys[self.theme_dropdown.get_selected()]
-        self.config['default_folder'] = self.folder_entry.get_text().strip()
-        self.config['show_file_panel'] = self.file_panel_check.get_active()
-        self.config['show_ai_panel'] = self.ai_panel_check.get_active()
-        self.config['max_tokens'] = int(self.max_tokens_spin.get_value())
-
-        start = self.prompt_buffer.get_start_iter()
-        end = self.prompt_buffer.get_end_iter()
-        self.config['system_prompt'] = self.prompt_buffer.get_text(start, end, False)
-
-        Config.save(self.config)
-        self.parent_window.config = self.config
-        self.parent_window.apply_settings()
-        self.close()
+        values = {
+            'llama_cpp_url': self.url_entry.get_text(),
+            'temperature': self.temp_spin.get_value(),
+            'editor_font': self.font_entry.get_text().strip() or "Monospace 11",
+            'show_line_numbers': self.line_numbers_check.get_active(),
+            'wrap_text': self.wrap_text_check.get_active(),
+            'flat_ui': self.flat_ui_check.get_active(),
+            'theme': _THEME_KEYS[self.theme_dropdown.get_selected()],
+            'default_folder': self.folder_entry.get_text().strip(),
+            'show_file_panel': self.file_panel_check.get_active(),
+            'show_ai_panel': self.ai_panel_check.get_active(),
+            'max_tokens': int(self.max_tokens_spin.get_value()),
+        }
+        if self.prompt_buffer.get_modified():
+            start = self.prompt_buffer.get_start_iter()
+            end = self.prompt_buffer.get_end_iter()
+            values['system_prompt'] = self.prompt_buffer.get_text(start, end, False)
 
+        # Only fields that differ are merged into the window's config, in place
+        self._pending = {k: v for k, v in values.items() if v != self._original.get(k)}
+        self.set_visible(False)
+        if not self._pending:
+            return  # Nothing changed: no disk write, nothing to re-apply
+        self._original.update(self._pending)
+        if 'system_prompt' in self._pending:
+            self.prompt_buffer.set_modified(False)
+            self._shown_prompt = self._pending['system_prompt']
+        _schedule_config_save(self._original)
+        self.parent_window.apply_settings(changed_keys=set(self._pending))
 
+
+@functools.cache
 def _app_dir():
     """Return the directory containing this script (for bundled assets)."""
     return Path(__file__).resolve().parent
@@ -1046,18 +1730,44 @@ AVAILABLE_THEMES = {
     "layan-dark":  ("layan-dark",  "layan-dark.css",  "layan-dark"),
     "cream-navy":  ("cream-navy",  "cream-navy.css",  "cream-navy"),
 }
+# Settings dropdown order and labels, fixed for the life of the app
+_THEME_KEYS = list(AVAILABLE_THEMES)
+_THEME_LABELS = [k.replace('-', ' ').title() for k in _THEME_KEYS]
+_THEME_STRINGLIST = None  # Gtk.StringList of _THEME_LABELS, built once GTK is up
+
+
+def _theme_stringlist():
+    global _THEME_STRINGLIST
+    if _THEME_STRINGLIST is None:
+        _THEME_STRINGLIST = Gtk.StringList.new(_THEME_LABELS)
+    return _THEME_STRINGLIST
 
 
+@functools.cache
 def _themes_dir():
     """Return the themes/ directory."""
     return _app_dir() / "themes"
 
-_active_css_provider = None  # keeps a ref so we can remove+replace it
-_active_font_provider = None
+_display = None  # Gdk.Display, cached by AIWriterApp.do_activate
+_perf_css_provider = None  # flat_ui overrides, installed above the theme
+_schemes_registered = False
+# Reads theme CSS files off the main loop; the last requested theme wins
+_css_loader = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+_requested_theme = None
+_theme_css_cache = {}  # theme_key -> CSS text, read once per theme
+_resources_registered = None  # None until _register_resources has looked
+# Theme and editor font share one provider so an apply restyles the widgets once
+_combined_provider = None
+_active_theme_css = ""
+_active_font_css = ""
 
 
 def _register_source_schemes():
     """Register every theme subfolder on the GtkSourceView search path."""
+    global _schemes_registered
+    if _schemes_registered:
+        return  # do_activate runs again for each new window
+    _schemes_registered = True
     manager = GtkSource.StyleSchemeManager.get_default()
     search_path = manager.get_search_path() or []
     for _key, (subfolder, _css, _scheme) in AVAILABLE_THEMES.items():
@@ -1066,52 +1776,139 @@ def _register_source_schemes():
             manager.prepend_search_path(d)
 
 
-def apply_app_theme(theme_key):
-    """Load (or hot-swap) the GTK4 CSS for *theme_key*."""
-    global _active_css_provider
-    display = Gdk.Display.get_default()
+def _register_resources():
+    """Register aiwriter.gresource if it was built; return whether it is available."""
+    global _resources_registered
+    if _resources_registered is None:
+        bundle = _app_dir() / "aiwriter.gresource"
+        _resources_registered = False
+        if bundle.exists():
+            try:
+                resource = Gio.Resource.load(str(bundle))
+            except GLib.Error:
+                pass  # Stale or corrupt bundle: read the CSS from themes/ as if it were absent
+            else:
+                Gio.resources_register(resource)
+                _resources_registered = True
+    return _resources_registered
+
+
+def _theme_css_from_resource(subfolder, css_file):
+    """Theme CSS from the compiled resource bundle, or None if it is not there."""
+    if not _register_resources():
+        return None
+    try:
+        data = Gio.resources_lookup_data(
+            f"/com/aiwriter/app/themes/{subfolder}/{css_file}", Gio.ResourceLookupFlags.NONE)
+    except GLib.Error:
+        return None
+    return data.get_data().decode("utf-8")
+
+
+def _rebuild_combined_css(theme_css, font_css, display=None):
+    """Load theme + font CSS into the shared provider, registering it on first use."""
+    global _combined_provider, _active_theme_css, _active_font_css
+    _active_theme_css, _active_font_css = theme_css, font_css
+    if _combined_provider is None:
+        _combined_provider = Gtk.CssProvider()
+        _combined_provider.load_from_string(f"{theme_css}\n{font_css}")
+        Gtk.StyleContext.add_provider_for_display(
+            display or _display or Gdk.Display.get_default(), _combined_provider,
+            Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION,
+        )
+    else:
+        _combined_provider.load_from_string(f"{theme_css}\n{font_css}")
+
+
+def apply_app_theme(theme_key, display=None):
+    """Load (or hot-swap) the GTK4 CSS for *theme_key*.
+    
+    A theme not loaded before is read on _css_loader and installed from an
+    idle callback, and only if no other theme was requested meanwhile. The
+    old theme stays active until then.
+    """
+    global _requested_theme
+    if theme_key == _requested_theme:
+        return  # Already active (or still loading): nothing to re-parse
+    _requested_theme = theme_key
 
-    # Remove the old provider if one is active
-    if _active_css_provider is not None:
-        Gtk.StyleContext.remove_provider_for_display(display, _active_css_provider)
-        _active_css_provider = None
+    css = _theme_css_cache.get(theme_key)
+    if css is not None:
+        _rebuild_combined_css(css, _active_font_css, display)
+        return
 
     entry = AVAILABLE_THEMES.get(theme_key)
-    if entry is None:
+    # A built resource bundle is already in memory: no file access needed
+    css = _theme_css_from_resource(*entry[:2]) if entry else None
+    if css is not None:
+        _theme_css_cache[theme_key] = css
+        _rebuild_combined_css(css, _active_font_css, display)
         return
-    subfolder, css_file, _scheme_id = entry
-    css_path = _themes_dir() / subfolder / css_file
-    if not css_path.exists():
+    css_path = _themes_dir() / entry[0] / entry[1] if entry else None
+    if css_path is None or not css_path.exists():
+        _rebuild_combined_css("", _active_font_css, display)
         return
+    future = _css_loader.submit(css_path.read_text, encoding="utf-8")
+    future.add_done_callback(lambda f: GLib.idle_add(_install_theme_css, theme_key, f))
 
-    provider = Gtk.CssProvider()
-    provider.load_from_path(str(css_path))
-    Gtk.StyleContext.add_provider_for_display(
-        display, provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION,
-    )
-    _active_css_provider = provider
 
+def _install_theme_css(theme_key, future):
+    """Install CSS read by apply_app_theme if its theme is still the one wanted."""
+    global _requested_theme
+    try:
+        css = future.result()
+    except (OSError, ValueError):  # ValueError: the file is not valid UTF-8
+        # Forget the request so a later apply of this theme tries the read again
+        if theme_key == _requested_theme:
+            _requested_theme = None
+        return GLib.SOURCE_REMOVE
+    _theme_css_cache[theme_key] = css
+    if theme_key == _requested_theme:
+        _rebuild_combined_css(css, _active_font_css)
+    return GLib.SOURCE_REMOVE
 
-def apply_editor_font(config):
-    """Apply editor font from config via CSS (e.g. 'Monospace 11' -> 11pt Monospace)."""
-    global _active_font_provider
-    display = Gdk.Display.get_default()
-
-    if _active_font_provider is not None:
-        Gtk.StyleContext.remove_provider_for_display(display, _active_font_provider)
-        _active_font_provider = None
 
-    font_css = config.get("editor_font", "Monospace 11").strip()
+@functools.lru_cache(maxsize=8)
+def _font_to_css(font):
+    """CSS rule for an editor font setting ('Monospace 11' -> 11pt "Monospace")."""
+    font_css = font.strip()
     parts = font_css.split()
     if len(parts) >= 2 and parts[-1].isdigit():
         size, fam = parts[-1], " ".join(parts[:-1])
         font_css = f'{size}pt "{fam}"'
-    provider = Gtk.CssProvider()
-    provider.load_from_string(f".source-editor {{ font: {font_css}; }}")
+    # Type + class selector: only textview nodes are even tested against it
+    return f"textview.source-editor {{ font: {font_css}; }}"
+
+
+def apply_editor_font(config, display=None):
+    """Apply editor font from config via CSS (e.g. 'Monospace 11' -> 11pt Monospace)."""
+    font_css = _font_to_css(config.get("editor_font", "Monospace 11"))
+    if font_css == _active_font_css:
+        return
+    _rebuild_combined_css(_active_theme_css, font_css, display)
+
+
+# Drops shadows and transitions the software renderer would otherwise redraw
+_FLAT_UI_CSS = (
+    "textview, .source-editor, scrolledwindow, button { box-shadow: none; transition: none; } "
+    "popover, menu { border-radius: 0; }"
+)
+
+
+def apply_flat_ui(enabled, display=None):
+    """Install or remove the flat-style overrides on top of the theme CSS."""
+    global _perf_css_provider
+    display = display or _display or Gdk.Display.get_default()
+    if not enabled:
+        if _perf_css_provider is not None:
+            Gtk.StyleContext.remove_provider_for_display(display, _perf_css_provider)
+        return
+    if _perf_css_provider is None:
+        _perf_css_provider = Gtk.CssProvider()
+        _perf_css_provider.load_from_string(_FLAT_UI_CSS)
     Gtk.StyleContext.add_provider_for_display(
-        display, provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION,
+        display, _perf_css_provider, Gtk.STYLE_PROVIDER_PRIORITY_APPLICATION + 1,
     )
-    _active_font_provider = provider
 
 
 class AIWriterApp(Gtk.Application):
@@ -1122,13 +1919,20 @@ class AIWriterApp(Gtk.Application):
         )
 
     def do_activate(self):
+        global _display
+        _display = Gdk.Display.get_default()
         _register_source_schemes()
         config = Config.load()
-        apply_app_theme(config.get('theme', 'layan-dark'))
-        apply_editor_font(config)
+        apply_app_theme(config.get('theme', 'layan-dark'), _display)
+        apply_editor_font(config, _display)
+        apply_flat_ui(config.get('flat_ui', False), _display)
         win = AIWriter(self)
         win.present()
 
+    def do_shutdown(self):
+        _flush_config()  # Don't lose a settings save still waiting for its timeout
+        Gtk.Application.do_shutdown(self)
+
 
 if __name__ == '__main__':
     import sys
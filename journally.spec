@@ -14,7 +14,7 @@ a = Analysis(
     runtime_hooks=[],
     excludes=[],
     noarchive=False,
-    optimize=0,
+    optimize=2,  # Bundle -OO bytecode (no docstrings/asserts): smaller archive, less to unmarshal
 )
 
 pyz = PYZ(a.pure)
@@ -1,19 +1,63 @@
 """
 Journally Web – Flask backend
 Provides API routes for file operations, AI proxy, and config management.
+
+`python app.py` starts the Flask development server. To serve many clients,
+run it from this directory under gunicorn's gevent worker instead, so that
+streaming chats and other long requests wait cooperatively:
+
+    gunicorn -k gevent -w 1 --worker-connections 500 -b 0.0.0.0:5000 app:app
+
+Keep it to one worker process: script jobs are tracked in process memory.
+gunicorn's gevent worker monkey-patches the stdlib itself before loading the
+app, so no gevent import is needed here.
 """
 
 import json
 import os
+import re
+import stat
 import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
 from pathlib import Path
 
-from flask import Flask, jsonify, render_template, request, send_from_directory
+from flask import Flask, Response, jsonify, render_template, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 
 import requests as http_requests
 
+try:
+    import orjson
+except ImportError:  # optional speed-up; the stdlib json provider is used without it
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # optional; tree listings are JSON only without it
+    msgpack = None
+
 app = Flask(__name__)
 
+
+class _OrjsonProvider(DefaultJSONProvider):
+    """JSON provider that encodes and decodes with orjson."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+if orjson:
+    # jsonify() and request.json both go through app.json
+    app.json = _OrjsonProvider(app)
+
 # ── Config helpers ────────────────────────────────────────────────────────────
 
 def _config_path():
@@ -41,19 +85,54 @@ DEFAULT_CONFIG = {
 }
 
 
+# ((st_mtime_ns, st_size), parsed config) from the last read of the config file
+_cfg_cache = None
+
+
 def load_config():
+    """Return a copy of the config, re-reading the file only when it changed."""
+    global _cfg_cache
     path = _config_path()
-    if path.exists():
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return DEFAULT_CONFIG.copy()
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _cfg_cache
+    if cached is None or cached[0] != key:
+        cfg = DEFAULT_CONFIG.copy()
         with open(path) as f:
-            return {**DEFAULT_CONFIG, **json.load(f)}
-    return DEFAULT_CONFIG.copy()
+            cfg.update(json.load(f))
+        cached = (key, cfg)
+        _cfg_cache = cached
+    return dict(cached[1])
 
 
 def save_config(cfg):
+    """Write the config atomically and prime the load cache with it."""
+    global _cfg_cache
     path = _config_path()
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w") as f:
-        json.dump(cfg, f, indent=2)
+    # Write a uniquely named file beside the real one and swap it in, so readers
+    # never see half a config and concurrent saves (or the desktop app) don't collide
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(cfg, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+            # A rename keeps mtime and size, so this is the stat of the installed file
+            st = os.fstat(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+    saved = DEFAULT_CONFIG.copy()
+    saved.update(cfg)
+    _cfg_cache = ((st.st_mtime_ns, st.st_size), saved)
 
 
 # ── Page routes ───────────────────────────────────────────────────────────────
@@ -80,26 +159,128 @@ def set_config():
 
 # ── File tree API ─────────────────────────────────────────────────────────────
 
-def _build_tree(root: Path):
-    """Return a nested dict representing the directory tree."""
-    entries = []
+# Deepest listing /api/files/tree will build in one response
+TREE_MAX_DEPTH = 16
+
+# Directory listing is bound by syscall latency, so scans overlap on these threads
+_scan_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="tree-scan")
+
+
+def _has_children(path):
+    """True when the directory at *path* has at least one non-hidden entry."""
     try:
-        for item in sorted(root.iterdir(), key=lambda x: (not x.is_dir(), x.name.lower())):
-            if item.name.startswith("."):
-                continue
-            node = {
-                "name": item.name,
-                "path": str(item),
-                "is_dir": item.is_dir(),
-            }
-            if item.is_dir():
-                node["children"] = _build_tree(item)
-            entries.append(node)
-    except PermissionError:
-        pass
+        with os.scandir(path) as it:
+            return any(entry.name[:1] != "." for entry in it)
+    except OSError:
+        return False
+
+
+def _list_dir(folder):
+    """Return the non-hidden entries of *folder*, directories first."""
+    with os.scandir(folder) as it:
+        # DirEntry.is_dir() is answered from the directory listing and cached
+        items = [item for item in it if item.name[:1] != "."]
+    items.sort(key=lambda x: (not x.is_dir(), x.name.lower()))
+    return items
+
+
+def _scan_dir(folder):
+    """_list_dir for the scan pool: an unreadable folder lists as empty."""
+    try:
+        return _list_dir(folder)
+    except OSError:
+        return []
+
+
+def _dir_key(path):
+    """(device, inode) of a directory, used to notice symlink loops."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_dev, st.st_ino
+
+
+def _build_tree(root, depth=1):
+    """Return a nested dict representing the directory tree.
+
+    Only *depth* levels are listed (clamped to 1..TREE_MAX_DEPTH). Directories
+    carry ``has_children`` so the frontend can fetch deeper levels from
+    /api/files/children on expand. The nodes come from _walk_tree, so levels
+    are scanned in parallel and symlink loops are not followed.
+    """
+    depth = max(1, min(depth, TREE_MAX_DEPTH))
+    entries = []
+    children = {root: entries}  # folder path -> its list of child nodes
+    walked = []  # directory nodes the walk went into
+    for node in _walk_tree(root, depth):
+        children[node.pop("parent")].append(node)
+        if node["is_dir"] and "has_children" not in node:
+            node["children"] = children[node["path"]] = []
+            walked.append(node)
+    for node in walked:
+        node["has_children"] = bool(node["children"])
     return entries
 
 
+def _walk_tree(root, depth=0):
+    """Yield tree nodes breadth-first, each tagged with its parent folder.
+
+    Walks *depth* levels (0 means the whole tree). All folders of a level are
+    scanned in parallel. Directories on the last level are not entered and
+    carry ``has_children`` instead; a directory reached again through a
+    symlink is listed with ``has_children`` False and not walked twice.
+    """
+    seen = {_dir_key(root)}
+    folders = [root]
+    level = 1
+    while folders:
+        last_level = bool(depth) and level >= depth
+        next_folders = []
+        for folder, items in zip(folders, _scan_pool.map(_scan_dir, folders)):
+            subdirs = [item.path for item in items if item.is_dir()]
+            probe = _has_children if last_level else _dir_key
+            probed = dict(zip(subdirs, _scan_pool.map(probe, subdirs)))
+            for item in items:
+                is_dir = item.is_dir()
+                node = {
+                    "name": item.name,
+                    "path": item.path,
+                    "parent": folder,
+                    "is_dir": is_dir,
+                }
+                if is_dir:
+                    if last_level:
+                        node["has_children"] = probed[item.path]
+                    elif probed[item.path] is not None and probed[item.path] not in seen:
+                        seen.add(probed[item.path])
+                        next_folders.append(item.path)
+                    else:
+                        node["has_children"] = False
+                yield node
+        folders = next_folders
+        level += 1
+
+
+def _listing_response(payload):
+    """Encode a tree listing as MessagePack if the client asks for it, else JSON."""
+    if msgpack and request.accept_mimetypes.best_match(
+            ["application/json", "application/msgpack"]) == "application/msgpack":
+        return Response(msgpack.packb(payload, use_bin_type=True), mimetype="application/msgpack")
+    return jsonify(payload)
+
+
+def _revalidated(response):
+    """Tag a listing with a content ETag and answer 304 when the client has it.
+
+    The listing still has to be built, but an unchanged one is not re-sent.
+    """
+    response.vary.add("Accept")
+    response.add_etag()
+    response.headers["Cache-Control"] = "private, must-revalidate"
+    return response.make_conditional(request)
+
+
 @app.route("/api/files/browse", methods=["GET"])
 def browse_folders():
     """List subdirectories of a given path for the folder browser.
@@ -130,11 +311,13 @@ def browse_folders():
     parent = str(p.parent) if p.parent != p else ""
     dirs = []
     try:
-        for item in sorted(p.iterdir(), key=lambda x: x.name.lower()):
-            if item.is_dir() and not item.name.startswith("."):
-                dirs.append({"name": item.name, "path": str(item)})
+        with os.scandir(p) as it:
+            for item in it:
+                if item.name[:1] != "." and item.is_dir():
+                    dirs.append({"name": item.name, "path": item.path})
     except PermissionError:
         pass
+    dirs.sort(key=lambda d: d["name"].lower())
 
     return jsonify({"current": str(p), "parent": parent, "dirs": dirs})
 
@@ -142,19 +325,61 @@ def browse_folders():
 @app.route("/api/files/tree", methods=["GET"])
 def file_tree():
     folder = request.args.get("folder", "")
+    depth = request.args.get("depth", 1, type=int)
     if not folder:
         cfg = load_config()
         folder = cfg.get("default_folder", "")
     if not folder or not Path(folder).is_dir():
         return jsonify({"tree": [], "root": ""})
-    return jsonify({"tree": _build_tree(Path(folder)), "root": folder})
+    return _revalidated(_listing_response({"tree": _build_tree(folder, depth), "root": folder}))
+
+
+@app.route("/api/files/tree_stream", methods=["GET"])
+def file_tree_stream():
+    """Stream the tree as newline-delimited JSON, one node per line.
+
+    Same query params as /api/files/tree, but ``depth`` defaults to 0 (the
+    whole tree). The resolved root folder is sent in the X-Tree-Root header.
+    """
+    folder = request.args.get("folder", "")
+    depth = request.args.get("depth", 0, type=int)
+    if not folder:
+        cfg = load_config()
+        folder = cfg.get("default_folder", "")
+    if not folder or not Path(folder).is_dir():
+        return Response("", mimetype="application/x-ndjson", headers={"X-Tree-Root": ""})
+    lines = (app.json.dumps(node) + "\n" for node in _walk_tree(folder, depth))
+    return Response(lines, mimetype="application/x-ndjson", headers={"X-Tree-Root": folder})
+
+
+@app.route("/api/files/children", methods=["GET"])
+def file_children():
+    """List the immediate children of a directory when it is expanded."""
+    folder = request.args.get("path", "")
+    if not folder or not Path(folder).is_dir():
+        return jsonify({"tree": [], "error": "Not a directory"}), 400
+    return _revalidated(_listing_response({"tree": _build_tree(folder), "path": folder}))
+
+
+# Larger files are only served through /api/files/read?raw=1
+READ_JSON_MAX_BYTES = 10 * 1024 * 1024
 
 
 @app.route("/api/files/read", methods=["GET"])
 def read_file_api():
+    """Return a file's text as JSON, or its raw bytes when ``raw=1`` is given.
+
+    Raw responses are streamed from disk and honour Range and conditional
+    (If-Modified-Since / If-None-Match) headers.
+    """
     fpath = request.args.get("path", "")
     if not fpath or not os.path.isfile(fpath):
         return jsonify({"error": "File not found"}), 404
+    if request.args.get("raw"):
+        return send_from_directory(os.path.dirname(os.path.abspath(fpath)), os.path.basename(fpath),
+                                   conditional=True)
+    if os.path.getsize(fpath) > READ_JSON_MAX_BYTES:
+        return jsonify({"error": "File too large to open"}), 413
     try:
         with open(fpath, "r", encoding="utf-8", errors="replace") as f:
             content = f.read()
@@ -216,23 +441,44 @@ def list_scripts():
         return jsonify({"scripts": [], "error": "No 'scripts' folder found"})
     
     try:
-        py_files = sorted(scripts_dir.glob("*.py"))
-        scripts = [{"name": f.name, "path": str(f)} for f in py_files]
+        with os.scandir(scripts_dir) as it:
+            scripts = [{"name": e.name, "path": e.path} for e in it
+                       if e.name.endswith(".py") and e.is_file()]
+        scripts.sort(key=lambda d: d["name"])
         return jsonify({"scripts": scripts})
     except Exception as e:
         return jsonify({"scripts": [], "error": str(e)})
 
 
-@app.route("/api/scripts/run", methods=["POST"])
-def run_script():
+# Scripts run on worker threads (subprocess.run waits without holding the
+# GIL), so a long script no longer ties up the request that started it.
+_scripts_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="script")
+_jobs = {}  # job id -> Future resolving to the _run_script_job result
+_jobs_finished = {}  # job id -> time.monotonic() when it finished
+_jobs_lock = threading.Lock()
+# Output of a finished job that is never polled (page closed) is dropped after this
+JOB_RESULT_TTL = 600
+
+
+def _job_finished(job_id, future):
+    """Done callback: note when a job finished so _expire_jobs can age it out."""
+    with _jobs_lock:
+        if job_id in _jobs:
+            _jobs_finished[job_id] = time.monotonic()
+
+
+def _expire_jobs():
+    """Forget finished jobs that nobody polled within JOB_RESULT_TTL seconds."""
+    cutoff = time.monotonic() - JOB_RESULT_TTL
+    with _jobs_lock:
+        for job_id in [j for j, t in _jobs_finished.items() if t < cutoff]:
+            del _jobs_finished[job_id]
+            del _jobs[job_id]
+
+
+def _run_script_job(script_path):
     """Run a Python script and return its output."""
     import subprocess
-    data = request.json
-    script_path = data.get("path", "")
-    
-    if not script_path or not os.path.isfile(script_path):
-        return jsonify({"error": "Script not found", "stdout": "", "stderr": "", "returncode": -1}), 404
-    
     try:
         # Determine working directory (scripts folder if script is in one)
         script_dir = Path(script_path).parent
@@ -245,66 +491,75 @@ def run_script():
             text=True,
             timeout=300,
         )
-        return jsonify({
+        return {
             "stdout": result.stdout or "",
             "stderr": result.stderr or "",
             "returncode": result.returncode,
-        })
+        }
     except subprocess.TimeoutExpired:
-        return jsonify({
+        return {
             "error": "Script timed out after 300 seconds",
             "stdout": "",
             "stderr": "Script timed out after 300 seconds.",
             "returncode": -1,
-        })
+        }
     except Exception as e:
-        return jsonify({
+        return {
             "error": str(e),
             "stdout": "",
             "stderr": str(e),
             "returncode": -1,
-        })
+        }
 
 
-# ── Theme API ────────────────────────────────────────────────────────────────
-
-@app.route("/api/theme/<theme_key>")
-def get_theme(theme_key):
-    """Serve the CSS file for a theme, converted from GTK CSS to web CSS."""
-    themes_dir = Path(__file__).resolve().parent.parent / "themes"
-    theme_map = {
-        "layan-dark": "layan-dark/layan-dark.css",
-        "cream-navy": "cream-navy/cream-navy.css",
-    }
-    
-    if theme_key not in theme_map:
-        return "/* Theme not found */", 404
-    
-    css_path = themes_dir / theme_map[theme_key]
-    if not css_path.exists():
-        return "/* Theme file not found */", 404
-    
-    # Read GTK CSS
-    with open(css_path, "r", encoding="utf-8") as f:
-        gtk_css = f.read()
-    
-    # Extract color variables
-    import re
-    color_vars = {}
-    for match in re.finditer(r"@define-color\s+(\w+)\s+([^;]+);", gtk_css):
-        var_name = match.group(1)
-        var_value = match.group(2).strip()
-        color_vars[var_name] = var_value
+@app.route("/api/scripts/run", methods=["POST"])
+def run_script():
+    """Start a Python script in the background and return its job id."""
+    data = request.json
+    script_path = data.get("path", "")
     
-    # Create web-compatible CSS with color variables
-    web_css = "/* Web theme converted from GTK CSS */\n\n:root {\n"
-    for var_name, var_value in color_vars.items():
-        web_css += f"    --{var_name}: {var_value};\n"
-    web_css += "}\n\n"
+    if not script_path or not os.path.isfile(script_path):
+        return jsonify({"error": "Script not found", "stdout": "", "stderr": "", "returncode": -1}), 404
     
-    # Apply theme-specific styles
-    if theme_key == "layan-dark":
-        web_css += """
+    _expire_jobs()
+    job_id = uuid.uuid4().hex
+    future = _scripts_pool.submit(_run_script_job, script_path)
+    with _jobs_lock:
+        _jobs[job_id] = future
+    # Outside the lock: the callback runs right away if the job already finished
+    future.add_done_callback(partial(_job_finished, job_id))
+    return jsonify({"job_id": job_id})
+
+
+@app.route("/api/scripts/status/<job_id>", methods=["GET"])
+def script_status(job_id):
+    """Report whether a script job has finished, with its output once it has."""
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+    if future is None:
+        return jsonify({"error": "Unknown job", "done": True, "stdout": "", "stderr": "", "returncode": -1}), 404
+    if not future.done():
+        return jsonify({"done": False})
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
+        _jobs_finished.pop(job_id, None)
+    return jsonify({"done": True, **future.result()})
+
+
+# ── Theme API ────────────────────────────────────────────────────────────────
+
+_THEMES_DIR = Path(__file__).resolve().parent.parent / "themes"
+_THEME_FILES = {
+    "layan-dark": "layan-dark/layan-dark.css",
+    "cream-navy": "cream-navy/cream-navy.css",
+}
+_DEFINE_COLOR_RE = re.compile(r"@define-color\s+(\w+)\s+([^;]+);")
+# theme_key -> (st_mtime_ns of the GTK CSS, converted web CSS as UTF-8 bytes)
+_theme_cache = {}
+
+
+# Web styles layered on top of each theme's color variables
+_LAYAN_DARK_CSS = """
 body {
     background: var(--theme_bg_color);
     color: var(--theme_fg_color);
@@ -375,8 +630,8 @@ body {
     background: rgba(86, 87, 245, 0.12);
 }
 """
-    elif theme_key == "cream-navy":
-        web_css += """
+
+_CREAM_NAVY_CSS = """
 body {
     background: var(--theme_bg_color);
     color: var(--theme_fg_color);
@@ -449,13 +704,137 @@ body {
     background: rgba(27, 42, 74, 0.05);
 }
 """
+
+_THEME_STYLES = {
+    "layan-dark": _LAYAN_DARK_CSS,
+    "cream-navy": _CREAM_NAVY_CSS,
+}
+
+
+def _gtk_to_web_css(theme_key, gtk_css):
+    """Convert a GTK theme stylesheet into the CSS served to the browser."""
+    # Extract color variables
+    color_vars = dict(_DEFINE_COLOR_RE.findall(gtk_css))
     
-    return web_css, 200, {"Content-Type": "text/css"}
+    # Create web-compatible CSS with color variables, then the theme-specific styles
+    parts = ["/* Web theme converted from GTK CSS */\n\n:root {\n"]
+    parts.extend(f"    --{var_name}: {var_value.strip()};\n" for var_name, var_value in color_vars.items())
+    parts.append("}\n\n")
+    parts.append(_THEME_STYLES.get(theme_key, ""))
+    return "".join(parts)
+
+
+def _compiled_theme(theme_key):
+    """Return (mtime_ns, css bytes) for a theme, or None if its file is missing.
+
+    The conversion only reruns when the GTK CSS file has changed.
+    """
+    css_path = _THEMES_DIR / _THEME_FILES[theme_key]
+    try:
+        mtime_ns = css_path.stat().st_mtime_ns
+    except FileNotFoundError:
+        return None
+    cached = _theme_cache.get(theme_key)
+    if cached is None or cached[0] != mtime_ns:
+        with open(css_path, "r", encoding="utf-8") as f:
+            cached = (mtime_ns, _gtk_to_web_css(theme_key, f.read()).encode())
+        _theme_cache[theme_key] = cached
+    return cached
+
+
+@app.route("/api/theme/<theme_key>")
+def get_theme(theme_key):
+    """Serve the CSS file for a theme, converted from GTK CSS to web CSS."""
+    if theme_key not in _THEME_FILES:
+        return "/* Theme not found */", 404
+    
+    try:
+        compiled = _compiled_theme(theme_key)
+    except (OSError, ValueError) as e:
+        return f"/* Theme file could not be read: {e} */", 500
+    if compiled is None:
+        return "/* Theme file not found */", 404
+    
+    mtime_ns, css = compiled
+    response = Response(css, mimetype="text/css")
+    response.last_modified = mtime_ns / 1e9
+    response.set_etag(f"{theme_key}-{mtime_ns}")
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+
+# Convert every theme at startup so no request pays for it. An unreadable
+# theme is skipped here; its route reports the error instead.
+for _theme_key in _THEME_FILES:
+    try:
+        _compiled_theme(_theme_key)
+    except (OSError, ValueError):
+        pass
+
+
+# One pooled session for llama.cpp so chat turns reuse the TCP connection
+_http = http_requests.Session()
+_http_adapter = http_requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8)
+_http.mount("http://", _http_adapter)
+_http.mount("https://", _http_adapter)
+_http.headers["Connection"] = "keep-alive"
+
+# Context files are read in parallel so a chat waits for the slowest file, not the sum
+_io_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="ctx-read")
+
+
+@lru_cache(maxsize=128)
+def _read_ctx(fp, mtime_ns, limit):
+    """Read at most *limit* characters of *fp*.
+
+    *mtime_ns* is only part of the cache key, so an edited file is read again.
+    """
+    with open(fp, "r", encoding="utf-8", errors="replace") as f:
+        return f.read(limit)
+
+
+def _read_text(fp, limit):
+    """Return up to *limit* characters of the regular file *fp*, or None."""
+    try:
+        st = os.stat(fp)
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return _read_ctx(fp, st.st_mtime_ns, limit)
+    except Exception:
+        return None
+
+
+def _sse_gen(resp):
+    """Relay the content deltas of a streamed llama.cpp reply as SSE events.
+
+    Each event is ``{"token": ...}``; a failure mid-stream is sent as
+    ``{"error": ...}`` and the stream always ends with ``[DONE]``.
+    """
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            payload = line[len("data: "):]
+            if payload == "[DONE]":
+                break
+            choices = json.loads(payload).get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                yield f"data: {json.dumps({'token': delta})}\n\n"
+    except Exception as e:
+        yield f"data: {json.dumps({'error': str(e)})}\n\n"
+    finally:
+        resp.close()
+    yield "data: [DONE]\n\n"
 
 
 @app.route("/api/ai/chat", methods=["POST"])
 def ai_chat():
-    """Proxy chat request to the llama.cpp server."""
+    """Proxy chat request to the llama.cpp server.
+
+    The reply is streamed back as server-sent events; errors that occur before
+    streaming starts are returned as JSON.
+    """
     cfg = load_config()
     data = request.json
     user_message = data.get("message", "")
@@ -465,33 +844,35 @@ def ai_chat():
     messages = [{"role": "system", "content": cfg["system_prompt"]}]
 
     # Build file context
+    # Roughly four characters per token, so no single file can exceed the budget
+    limit = cfg["context_max_tokens"] * 4
+    futures = {fp: _io_pool.submit(_read_text, fp, limit) for fp in context_files}
     context_parts = []
-    for fp in context_files:
-        if os.path.isfile(fp):
-            try:
-                with open(fp, "r", encoding="utf-8", errors="replace") as f:
-                    content = f.read()
-                context_parts.append(f"=== {os.path.basename(fp)} ===\n{content}\n")
-            except Exception:
-                pass
+    for fp, future in futures.items():
+        content = future.result()
+        if content is not None:
+            context_parts.append(f"=== {os.path.basename(fp)} ===\n{content}\n")
     if context_parts:
         messages.append({"role": "system", "content": "Files in context:\n" + "\n".join(context_parts)})
 
     messages.append({"role": "user", "content": user_message})
 
     try:
-        resp = http_requests.post(
+        resp = _http.post(
             f"{cfg['llama_cpp_url']}/v1/chat/completions",
             json={
                 "messages": messages,
                 "temperature": cfg["temperature"],
                 "max_tokens": cfg["max_tokens"],
+                "stream": True,
             },
+            stream=True,
             timeout=120,
         )
         if resp.status_code == 200:
-            ai_msg = resp.json()["choices"][0]["message"]["content"]
-            return jsonify({"response": ai_msg})
+            return Response(_sse_gen(resp), mimetype="text/event-stream",
+                            headers={"Cache-Control": "no-cache"})
+        resp.close()
         return jsonify({"error": f"API error: {resp.status_code}"}), 502
     except http_requests.exceptions.ConnectionError:
         return jsonify({"error": "Cannot connect to llama.cpp server."}), 502
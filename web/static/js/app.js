@@ -74,6 +74,36 @@
         return res.json();
     }
 
+    // Call onLine for each complete line of a streamed response as it arrives
+    async function readLines(res, onLine) {
+        const reader = res.body.getReader();
+        const decoder = new TextDecoder();
+        let buffered = "";
+        for (;;) {
+            const { value, done } = await reader.read();
+            buffered += decoder.decode(value, { stream: !done });
+            const lines = buffered.split("\n");
+            buffered = done ? "" : lines.pop();
+            for (const line of lines) {
+                if (line) onLine(line);
+            }
+            if (done) break;
+        }
+    }
+
+    async function readNDJSON(res, onItem) {
+        return readLines(res, line => onItem(JSON.parse(line)));
+    }
+
+    // Server-sent events over a fetch() body (EventSource cannot POST)
+    async function readSSE(res, onEvent) {
+        return readLines(res, line => {
+            if (!line.startsWith("data: ")) return;
+            const payload = line.slice(6);
+            if (payload !== "[DONE]") onEvent(JSON.parse(payload));
+        });
+    }
+
     async function postJSON(url, body) {
         return api(url, {
             method: "POST",
@@ -196,13 +226,13 @@
 
     // ── File Tree ────────────────────────────────────────────────────────────
     async function loadFileTree(folder) {
-        const data = await api(`/api/files/tree?folder=${encodeURIComponent(folder)}`);
-        rootFolder = data.root || folder;
-        $fileTree.innerHTML = "";
-        if (data.tree.length) {
-            const ul = buildTreeUL(data.tree);
-            $fileTree.appendChild(ul);
-        } else {
+        // Rows are added as the top level streams in; folders load on expand
+        const res = await fetch(`/api/files/tree_stream?folder=${encodeURIComponent(folder)}&depth=1`);
+        rootFolder = res.headers.get("X-Tree-Root") || folder;
+        const ul = document.createElement("ul");
+        $fileTree.replaceChildren(ul);
+        await readNDJSON(res, node => ul.append(...buildTreeUL([node]).childNodes));
+        if (!ul.childElementCount) {
             $fileTree.innerHTML = '<div style="padding:12px;color:var(--text-muted);font-size:13px;">No files. Open a folder first.</div>';
         }
     }
@@ -233,13 +263,32 @@
 
                 li.appendChild(row);
 
-                // Children
-                if (node.children && node.children.length) {
-                    const childUL = buildTreeUL(node.children);
+                // Children (fetched on first expand unless already sent)
+                if (node.has_children) {
+                    let loaded = Boolean(node.children);
+                    let loading = false;
+                    const childUL = loaded ? buildTreeUL(node.children) : document.createElement("ul");
                     childUL.className = "tree-children";
                     li.appendChild(childUL);
 
-                    row.addEventListener("click", () => {
+                    row.addEventListener("click", async () => {
+                        if (loading) return;
+                        if (!loaded) {
+                            // Only marked loaded once the children are in, so a failure can be retried
+                            loading = true;
+                            try {
+                                const res = await fetch(`/api/files/children?path=${encodeURIComponent(node.path)}`);
+                                const data = await res.json();
+                                if (!res.ok) throw new Error(data.error || `Error: ${res.status}`);
+                                childUL.replaceChildren(...buildTreeUL(data.tree).childNodes);
+                                loaded = true;
+                            } catch (err) {
+                                addChatMessage("error", `Could not list ${node.name}: ${err.message}`);
+                                return;
+                            } finally {
+                                loading = false;
+                            }
+                        }
                         childUL.classList.toggle("open");
                         toggle.classList.toggle("open");
                     });
@@ -457,17 +506,31 @@
         addChatMessage("system", "Thinking…");
 
         try {
-            const data = await postJSON("/api/ai/chat", { message: msg, context_files: ctx });
+            const res = await fetch("/api/ai/chat", {
+                method: "POST",
+                headers: { "Content-Type": "application/json" },
+                body: JSON.stringify({ message: msg, context_files: ctx }),
+            });
             // Remove "Thinking…"
             const last = $chatHistory.lastElementChild;
             if (last && last.classList.contains("system") && last.textContent.includes("Thinking")) {
                 last.remove();
             }
-            if (data.error) {
-                addChatMessage("error", data.error);
-            } else {
-                addChatMessage("ai", data.response);
+            // Errors before the reply starts come back as JSON
+            if (!(res.headers.get("Content-Type") || "").startsWith("text/event-stream")) {
+                const data = await res.json();
+                addChatMessage("error", data.error || `Error: ${res.status}`);
+                return;
             }
+            const reply = addChatMessage("ai", "");
+            await readSSE(res, event => {
+                if (event.error) {
+                    addChatMessage("error", event.error);
+                } else if (event.token) {
+                    reply.append(event.token);
+                    $chatHistory.scrollTop = $chatHistory.scrollHeight;
+                }
+            });
         } catch (err) {
             // Remove "Thinking…"
             const last = $chatHistory.lastElementChild;
@@ -490,6 +553,7 @@
         div.appendChild(body);
         $chatHistory.appendChild(div);
         $chatHistory.scrollTop = $chatHistory.scrollHeight;
+        return body;
     }
 
     // ── Open Folder dialog ───────────────────────────────────────────────────
@@ -705,7 +769,13 @@
         addChatMessage("system", `Running script: ${scriptPath.split(/[\\/]/).pop()}...`);
 
         try {
-            const data = await postJSON("/api/scripts/run", { path: scriptPath });
+            let data = await postJSON("/api/scripts/run", { path: scriptPath });
+            // The script runs in the background; poll until it has finished
+            while (data.job_id && !data.done) {
+                await new Promise(resolve => setTimeout(resolve, 500));
+                const status = await api(`/api/scripts/status/${data.job_id}`);
+                data = status.done ? status : data;
+            }
             showScriptOutput(scriptPath, data);
         } catch (err) {
             showScriptOutput(scriptPath, { error: err.message, stdout: "", stderr: "", returncode: -1 });